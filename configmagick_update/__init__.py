@@ -1,6 +1,8 @@
 import pathlib
 from .lib_main import pip_install
 from .lib_main import pip_update
+from .lib_updater import PackageResult
+from .lib_updater import Updater
 
 
 def get_version() -> str:
@@ -0,0 +1,89 @@
+# STDLIB
+import timeit
+from typing import Dict, List, Tuple
+
+# PROJ
+try:
+    from . import lib_link
+except ImportError:                 # for local development
+    import lib_link                 # type: ignore # pragma: no cover
+
+# a manifest like mix of package names, requirements and links
+LINKS = ['pip',
+         'wheel==0.32.3',
+         'urllib3>=1.24.1',
+         'chardet<4',
+         'https://github.com/pypa/pip.git',
+         'git+https://github.com/bitranox/lib_doctest_pycharm.git',
+         'https://github.com/pypa/pip/archive/master.zip',
+         'https://some_link/pypa/archive/master.zip']     # type: List[str]
+
+
+def legacy_get_package_type(package_link: str) -> str:
+    """ the link classifier before lib_link, for comparison """
+    if 'https://github.com/' in package_link:
+        return 'git_package'
+    elif '/' not in package_link:
+        return 'pypy_package'
+    elif not package_link:
+        return 'pypy_package'
+    else:
+        return 'weblink'
+
+
+def legacy_get_pypy_package_name_without_version(pypy_package: str) -> str:
+    """ the requirement parser before lib_link, for comparison """
+    pypy_package = pypy_package.split('=')[0]
+    pypy_package = pypy_package.split('>')[0]
+    pypy_package = pypy_package.split('<')[0]
+    return pypy_package
+
+
+def legacy_get_git_repository_slug_from_link(package_link: str) -> str:
+    """ the slug parser before lib_link, without the log banners, for comparison """
+    git_repository_slug = package_link.split('https://github.com/')[1]
+    git_repository_slug = git_repository_slug.rsplit('.', 1)[0]
+    git_repository_slug = '/'.join(git_repository_slug.split('/')[:2])
+    return git_repository_slug
+
+
+def benchmark(n_links: int = 1000, number: int = 100) -> Dict[str, Tuple[float, float]]:
+    """
+    :returns {operation: (µs legacy, µs lib_link)} per <n_links> links, the best of <number> runs.
+    lib_link is measured with a warm cache, like on a repeated converge of the same manifest
+
+    >>> results = benchmark(n_links=100, number=1)
+    >>> sorted(results)
+    ['package_name', 'package_type', 'repository_slug']
+    >>> assert all(seconds_legacy > 0 and seconds_lib_link > 0 for seconds_legacy, seconds_lib_link in results.values())
+
+    """
+    links = (LINKS * (n_links // len(LINKS) + 1))[:n_links]
+    pypy_links = [link for link in links if lib_link.parse_link(link).package_type == 'pypy_package']
+    git_links = [link for link in links if lib_link.parse_link(link).package_type == 'git_package']
+    for link in pypy_links:
+        assert legacy_get_pypy_package_name_without_version(link) == lib_link.parse_link(link).name
+    for link in git_links:
+        assert legacy_get_git_repository_slug_from_link(link) == lib_link.parse_link(link).git_repository_slug
+
+    l_cases = [('package_type', links, legacy_get_package_type, lambda link: lib_link.parse_link(link).package_type),
+               ('package_name', pypy_links, legacy_get_pypy_package_name_without_version, lambda link: lib_link.parse_link(link).name),
+               ('repository_slug', git_links, legacy_get_git_repository_slug_from_link, lambda link: lib_link.parse_link(link).git_repository_slug)]
+
+    results = dict()    # type: Dict[str, Tuple[float, float]]
+    for operation, case_links, legacy_function, lib_link_function in l_cases:
+        seconds_legacy = min(timeit.repeat(lambda: [legacy_function(link) for link in case_links], number=1, repeat=number))
+        seconds_lib_link = min(timeit.repeat(lambda: [lib_link_function(link) for link in case_links], number=1, repeat=number))
+        scale = 1000000 * n_links / len(case_links)     # µs per <n_links> links
+        results[operation] = (seconds_legacy * scale, seconds_lib_link * scale)
+    return results
+
+
+def main() -> None:
+    for operation, (microseconds_legacy, microseconds_lib_link) in benchmark().items():
+        print('{operation:<16} legacy: {legacy:8.1f} µs   lib_link: {lib_link:8.1f} µs   per 1000 links'
+              .format(operation=operation, legacy=microseconds_legacy, lib_link=microseconds_lib_link))
+
+
+if __name__ == '__main__':
+    main()                          # pragma: no cover
@@ -8,3 +8,18 @@ import configmagick_bash
 class Config(object):
     path_version_files_dir: pathlib.Path = configmagick_bash.get_path_home_dir_current_user() / '.config/configmagick/configmagick_update'
     path_version_file: pathlib.Path = path_version_files_dir / 'versions.dat'
+    # number of stdout / stderr lines kept from shell commands for error reports
+    stream_tail_lines: int = 50
+    # number of parsed package links kept in the memory cache
+    link_cache_size: int = 1024
+    # number of processes to precompile the installed packages, 0 = number of processors
+    precompile_workers: int = 0
+    # seconds after a smoke import of an updated package is considered failed
+    smoke_import_timeout: int = 60
+    # the wheels of the previous versions, to rollback without downloading
+    path_snapshots_dir: pathlib.Path = path_version_files_dir / 'snapshots'
+    path_snapshot_index_file: pathlib.Path = path_snapshots_dir / 'snapshots.dat'
+    # the oldest snapshots are removed when the snapshots together are bigger than that
+    snapshots_max_bytes: int = 500 * 1024 * 1024
+    # pending snapshots older than that are left over from crashed runs and are removed
+    snapshot_pending_max_seconds: int = 24 * 60 * 60
@@ -42,13 +42,26 @@ def main(sys_argv: List[str] = sys.argv[1:]) -> None:
         if argparse_namespace.which_parser == 'pip_install':
             lib_main.pip_install(package_name=argparse_namespace.package_name,
                                  package_link=argparse_namespace.package_link,
-                                 use_sudo=argparse_namespace.use_sudo
+                                 use_sudo=argparse_namespace.use_sudo,
+                                 precompile=argparse_namespace.precompile,
+                                 smoke_import=argparse_namespace.smoke_import,
+                                 run_id=argparse_namespace.run_id
                                  )
         elif argparse_namespace.which_parser == 'pip_update':
             lib_main.pip_update(package_name=argparse_namespace.package_name,
                                 package_link=argparse_namespace.package_link,
-                                use_sudo=argparse_namespace.use_sudo
+                                use_sudo=argparse_namespace.use_sudo,
+                                precompile=argparse_namespace.precompile,
+                                smoke_import=argparse_namespace.smoke_import,
+                                run_id=argparse_namespace.run_id
                                 )
+        elif argparse_namespace.which_parser == 'rollback':
+            if argparse_namespace.last_run:
+                lib_main.rollback_last_run(use_sudo=argparse_namespace.use_sudo)
+            elif argparse_namespace.package_name:
+                lib_main.rollback(package_name=argparse_namespace.package_name, use_sudo=argparse_namespace.use_sudo)
+            else:
+                parser.error('rollback needs a package name or --last_run')
         else:
             parser.print_help()
 
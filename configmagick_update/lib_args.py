@@ -28,6 +28,11 @@ def parse_args(cmd_args: List[str] = sys.argv[1:]) -> Tuple[argparse.Namespace,
     parser_pip_install.add_argument('package_link', metavar='link', nargs='?', default='',
                                     help='optional the package link to github e.g. "git+https://github.com/pypa/pip.git"')
     parser_pip_install.add_argument('--use_sudo', help='use sudo for pip', action="store_true")
+    parser_pip_install.add_argument('--precompile', help='precompile the python files of the updated package', action="store_true")
+    parser_pip_install.add_argument('--smoke_import', help='import the updated package in a fresh interpreter to verify it', action="store_true")
+    parser_pip_install.add_argument('--run_id', '--run-id', dest='run_id', default='',
+                                    help='updates with the same run id are rolled back together by "rollback --last_run", '
+                                         'default $CONFIGMAGICK_UPDATE_RUN_ID, otherwise a new id for each call')
     parser_pip_install.set_defaults(which_parser='pip_install')
 
     parser_pip_update = subparsers.add_parser('pip_update', help='updates pip packages from pypy or github')
@@ -35,8 +40,20 @@ def parse_args(cmd_args: List[str] = sys.argv[1:]) -> Tuple[argparse.Namespace,
     parser_pip_update.add_argument('package_link', metavar='link', nargs='?', default='',
                                    help='optional the package link to github e.g. "git+https://github.com/pypa/pip.git"')
     parser_pip_update.add_argument('--use_sudo', help='use sudo for pip', action="store_true")
+    parser_pip_update.add_argument('--precompile', help='precompile the python files of the updated package', action="store_true")
+    parser_pip_update.add_argument('--smoke_import', help='import the updated package in a fresh interpreter to verify it', action="store_true")
+    parser_pip_update.add_argument('--run_id', '--run-id', dest='run_id', default='',
+                                   help='updates with the same run id are rolled back together by "rollback --last_run", '
+                                        'default $CONFIGMAGICK_UPDATE_RUN_ID, otherwise a new id for each call')
     parser_pip_update.set_defaults(which_parser='pip_update')
 
+    parser_rollback = subparsers.add_parser('rollback', help='reinstalls the previous version of packages from the local snapshots')
+    parser_rollback.add_argument('package_name', metavar='package', nargs='?', default='', help='the pip package name e.g. "pip"')
+    parser_rollback.add_argument('--last_run', '--last-run', dest='last_run', action="store_true",
+                                 help='rollback all packages updated by the last run (see --run_id) - each call steps one run further back')
+    parser_rollback.add_argument('--use_sudo', help='use sudo for pip', action="store_true")
+    parser_rollback.set_defaults(which_parser='rollback')
+
     args = parser.parse_args(cmd_args)
 
     return args, parser
@@ -1,22 +1,32 @@
 # STDLIB
 import json
 import logging
-from typing import List
+import os
+import pathlib
+import re
+import stat
+import tempfile
+from typing import Any, Dict, List, Set
 
 # OWN
 from configmagick_bash import lib_bash
 import lib_log_utils
-import lib_regexp
-import lib_shell
 
 # PROJ
 try:
+    from . import lib_link
+    from . import lib_stream
     from .config import Config
 except ImportError:                 # for local development
+    import lib_link                 # type: ignore # pragma: no cover
+    import lib_stream               # type: ignore # pragma: no cover
     from config import Config       # type: ignore # pragma: no cover
 
 logger = logging.getLogger()
 
+# the zip links warned about by banner_warning_zip_link_once
+_warned_zip_links = set()           # type: Set[str]
+
 
 def get_package_type(package_link: str) -> str:
     """
@@ -28,14 +38,7 @@ def get_package_type(package_link: str) -> str:
     >>> assert get_package_type('https://github.com/pypa/archive/master.zip') == 'git_package'
     >>> assert get_package_type('https://some_link/pypa/archive/master.zip') == 'weblink'
     """
-    if 'https://github.com/' in package_link:
-        return 'git_package'
-    elif '/' not in package_link:
-        return 'pypy_package'
-    elif not package_link:
-        return 'pypy_package'
-    else:
-        return 'weblink'
+    return lib_link.parse_link(package_link).package_type
 
 
 def get_latest_pip_command() -> lib_bash.BashCommand:
@@ -98,13 +101,12 @@ def get_pypy_package_name_without_version(pypy_package: str) -> str:
     'wheel'
     >>> get_pypy_package_name_without_version('wheel>0.32.3')
     'wheel'
+    >>> get_pypy_package_name_without_version('wheel[extra]~=0.32.3; python_version<"3.8"')
+    'wheel'
 
     """
 
-    pypy_package = pypy_package.split('=')[0]
-    pypy_package = pypy_package.split('>')[0]
-    pypy_package = pypy_package.split('<')[0]
-    return pypy_package
+    return lib_link.parse_link(pypy_package).name
 
 
 def get_git_repository_slug_from_link(package_link: str) -> str:
@@ -118,37 +120,30 @@ def get_git_repository_slug_from_link(package_link: str) -> str:
 
     """
 
-    # https://github.com/pypa/pip.git | git+https://github.com/pypa/pip.git | https://github.com/pypa/pip/archive/master.zip
-    git_repository_slug = ''
-    try:
-        git_repository_slug = package_link.split('https://github.com/')[1]   # pypa/pip.git | pypa/pip.git | pypa/archive/master.zip
-        git_repository_slug = git_repository_slug.rsplit('.', 1)[0]                 # pypa/pip | pypa/pip | pypa/archive/master
-        git_repository_slug = '/'.join(git_repository_slug.split('/')[:2])         # bitranox/lib_path | bitranox/lib_doctest_pycharm
-        elements = git_repository_slug.split('/')
-
-        if len(elements) != 2 or len(elements[0]) == 0 or len(elements[1]) == 0:
-            error = 'can not get the repository slug "{git_repository_slug}" from link "{git_link}" - wrong link ?'\
-                .format(git_repository_slug=git_repository_slug, git_link=package_link)
+    git_repository_slug = lib_link.parse_link(package_link).git_repository_slug
+    if not git_repository_slug:
+        error = 'can not get the repository slug from link "{git_link}" - wrong link ?'.format(git_link=package_link)
+        lib_log_utils.banner_error(error)
+        raise ValueError(error)
 
-            lib_log_utils.banner_error(error)
-            raise ValueError(error)
+    if '.zip' in package_link.lower():
+        banner_warning_zip_link_once(package_link=package_link, git_repository_slug=git_repository_slug)
 
-        if '.zip' in package_link.lower():
-            sanitized_git_link = get_sanitized_git_link(git_repository_slug=git_repository_slug)
-            warning = 'better use "{sanitized_git_link}" than "{git_link} unless You need it for a reason"'\
-                .format(sanitized_git_link=sanitized_git_link, git_link=package_link)
-            lib_log_utils.banner_warning(warning)
+    return git_repository_slug
 
-        return git_repository_slug
-    except Exception:
-        error = 'can not get the repository slug "{git_repository_slug}" from link "{git_link}" - wrong link ?'\
-            .format(git_repository_slug=git_repository_slug, git_link=package_link)
 
-        lib_log_utils.banner_error(error)
-        raise ValueError(error)
+def banner_warning_zip_link_once(package_link: str, git_repository_slug: str) -> None:
+    """ shows the warning only once per link and process """
+    if package_link in _warned_zip_links:
+        return
+    _warned_zip_links.add(package_link)
+    sanitized_git_link = get_sanitized_git_link(git_repository_slug=git_repository_slug)
+    warning = 'better use "{sanitized_git_link}" than "{git_link} unless You need it for a reason"'\
+        .format(sanitized_git_link=sanitized_git_link, git_link=package_link)
+    lib_log_utils.banner_warning(warning)
 
 
-def get_git_remote_hash(git_repository_slug: str) -> str:
+def get_git_remote_hash(git_repository_slug: str, git_command_str: str = '') -> str:
     """
     >>> # https://github.com/pypa/pip.git | git+https://github.com/pypa/pip.git | https://github.com/pypa/archive/master.zip
 
@@ -158,12 +153,18 @@ def get_git_remote_hash(git_repository_slug: str) -> str:
     >>> assert len(get_git_remote_hash(git_repository_slug=git_repository_slug)) == len('59e6ce2847bda24b3f29683251d10ae5c3cab357')
     >>> git_repository_slug = get_git_repository_slug_from_link(package_link='https://github.com/pypa/pip/archive/master.zip')
     >>> assert len(get_git_remote_hash(git_repository_slug=git_repository_slug)) == len('59e6ce2847bda24b3f29683251d10ae5c3cab357')
+    >>> git_command_str = lib_bash.get_bash_command('git').command_string
+    >>> assert len(get_git_remote_hash(git_repository_slug, git_command_str)) == len('59e6ce2847bda24b3f29683251d10ae5c3cab357')
 
     """
     url = 'https://github.com/{git_repository_slug}.git'.format(git_repository_slug=git_repository_slug)
-    git_command = lib_bash.get_bash_command('git')
-    result = lib_shell.run_shell_ls_command([git_command.command_string, '--no-pager', 'ls-remote', '--quiet', url])
-    line = lib_regexp.reg_grep('HEAD', result.stdout)[0].expandtabs()
+    if not git_command_str:
+        git_command_str = lib_bash.get_bash_command('git').command_string
+    # ask only for HEAD, and stop reading as soon as it is found - repositories might have tens of thousands of refs
+    stream = lib_stream.ShellLineStream([git_command_str, '--no-pager', 'ls-remote', '--quiet', url, 'HEAD'])
+    line = lib_stream.grep_first(stream, 'HEAD').expandtabs()
+    if not line:
+        raise ValueError('can not get the remote HEAD hash from "{url}"'.format(url=url))
     git_remote_hash = str(line.split()[0])
     return git_remote_hash
 
@@ -174,47 +175,68 @@ def get_git_local_hash_from_directory(path_install_directory: str) -> str:
     return ''
 
 
-def get_git_local_hash_from_database_or_blank(key: str) -> str:
+def load_version_database() -> Dict[str, str]:
     """
+    :returns the git hashes hashed by key, an empty dict if there is no version file yet
+
     >>> save_path_version_file = Config.path_version_file
     >>> Config.path_version_file = Config.path_version_files_dir / 'test_database'
     >>> if Config.path_version_file.exists(): Config.path_version_file.unlink()
-    >>> data_dict=dict()
-    >>> assert (save_git_hash_to_database('a','A')) == True
-    >>> assert (save_git_hash_to_database('b','B')) == True
-    >>> assert (get_git_local_hash_from_database_or_blank('a')) == 'A'
-    >>> assert (get_git_local_hash_from_database_or_blank('b')) == 'B'
-    >>> assert (get_git_local_hash_from_database_or_blank('c')) == ''
+    >>> assert load_version_database() == dict()
+    >>> assert save_version_database({'a': 'A', 'b': 'B'}) == True
+    >>> assert load_version_database() == {'a': 'A', 'b': 'B'}
     >>> Config.path_version_file = save_path_version_file
 
     """
-
     if not Config.path_version_file.exists():
-        return ''
+        return dict()
 
     with open(str(Config.path_version_file), 'r') as f:
-        local_git_hash_hashed_by_key = json.load(f)
-
-    local_hash_from_database = str(local_git_hash_hashed_by_key.get(key, ''))    # '' if not found
-    return local_hash_from_database
+        local_git_hash_hashed_by_key = dict(json.load(f))    # type: Dict[str, str]
+    return local_git_hash_hashed_by_key
 
 
-def save_git_hash_to_database(key: str, git_hash: str) -> bool:
-
-    if Config.path_version_file.exists():
-        with open(str(Config.path_version_file), 'r') as f:
-            local_git_hash_hashed_by_key = json.load(f)
-    else:
-        local_git_hash_hashed_by_key = dict()
-
-    local_git_hash_hashed_by_key[key] = git_hash
-    with open(str(Config.path_version_file), 'w') as f:
-        json.dump(local_git_hash_hashed_by_key, f)
+def save_version_database(local_git_hash_hashed_by_key: Dict[str, str]) -> bool:
+    save_json_atomic(path_json_file=Config.path_version_file, data=local_git_hash_hashed_by_key)
     # lib_bash.fix_ownership(user=,fileobject=)  # TODO
     # lib_bash.fix_permissions(user=, fileobject=, recursive=True) # TODO
     return True
 
 
+def save_json_atomic(path_json_file: pathlib.Path, data: Any) -> None:
+    """
+    writes to a temporary file in the same directory and replaces the target, so readers never see a half written file
+
+    >>> import tempfile
+    >>> with tempfile.TemporaryDirectory() as tmp_dir:
+    ...     path_json_file = pathlib.Path(tmp_dir) / 'test.json'
+    ...     save_json_atomic(path_json_file, {'a': 'A'})
+    ...     path_json_file.chmod(0o664)
+    ...     save_json_atomic(path_json_file, {'b': 'B'})
+    ...     print(path_json_file.read_text(), sorted(path.name for path in pathlib.Path(tmp_dir).iterdir()), oct(path_json_file.stat().st_mode & 0o777))
+    {"b": "B"} ['test.json'] 0o664
+
+    """
+    if path_json_file.exists():
+        file_mode = stat.S_IMODE(path_json_file.stat().st_mode)
+    else:
+        umask = os.umask(0)
+        os.umask(umask)
+        file_mode = 0o666 & ~umask
+    # NamedTemporaryFile creates the file with 0o600 - keep the permissions of the replaced file
+    with tempfile.NamedTemporaryFile(mode='w', dir=str(path_json_file.parent), prefix=path_json_file.name, suffix='.tmp', delete=False) as f:
+        try:
+            os.chmod(f.name, file_mode)
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        except Exception:
+            f.close()
+            os.unlink(f.name)
+            raise
+    os.replace(f.name, str(path_json_file))
+
+
 def get_sanitized_git_link(git_repository_slug: str) -> str:
     """
     >>> assert get_sanitized_git_link(git_repository_slug='pypa/pip') == 'git+https://github.com/pypa/pip.git'
@@ -224,20 +246,14 @@ def get_sanitized_git_link(git_repository_slug: str) -> str:
     return sanitized_git_link
 
 
-def is_pip_package_installed(package_name: str) -> bool:
+def get_normalized_package_name(package_name: str) -> str:
     """
-    >>> assert is_pip_package_installed('pip') == True
-    >>> assert is_pip_package_installed('unknown_package') == False
+    pip lists package names with dash, even when they are installed with underscore (PEP 503 normalization)
 
+    >>> get_normalized_package_name('Lib_Doctest_Pycharm')
+    'lib-doctest-pycharm'
+    >>> get_normalized_package_name('zope.interface')
+    'zope-interface'
 
     """
-    package_name = package_name.replace('_', '-')    # even when the package name is with underscore, it is installed and listed with dash !
-
-    pip_command = get_latest_pip_command().command_string
-    ls_commands = [pip_command, "list"]
-    shell_response = lib_shell.run_shell_ls_command(ls_commands)
-    line = lib_regexp.reg_grep(package_name, shell_response.stdout)
-    if not line:
-        return False
-    else:
-        return True
+    return re.sub(r'[-_.]+', '-', package_name).lower()
@@ -0,0 +1,191 @@
+# STDLIB
+import functools
+import logging
+import re
+from typing import Any, Callable, NamedTuple, Tuple
+
+# PROJ
+try:
+    from .config import Config
+except ImportError:                 # for local development
+    from config import Config       # type: ignore # pragma: no cover
+
+logger = logging.getLogger()
+
+# PEP 440 - one version clause, e.g. '>=1.0'
+_VERSION_CLAUSE = r'(?:~=|===?|!=|<=?|>=?)\s*[^,;\s()]+'
+# PEP 508 - name [extras] specifier ; marker - the specifier are comma separated version clauses, optional in parentheses
+_REG_REQUIREMENT = re.compile(r'^(?P<name>[A-Za-z0-9](?:[A-Za-z0-9._-]*[A-Za-z0-9])?)\s*'
+                              r'(?:\[(?P<extras>[A-Za-z0-9._,\s-]*)\])?\s*'
+                              r'(?P<specifier>\(\s*{clause}(?:\s*,\s*{clause})*\s*\)|{clause}(?:\s*,\s*{clause})*)?\s*'
+                              r'(?:;\s*(?P<marker>.*?))?\s*$'.format(clause=_VERSION_CLAUSE))
+# PEP 508 - name [extras] @ url ; marker
+_REG_DIRECT_REFERENCE = re.compile(r'^(?P<name>[A-Za-z0-9](?:[A-Za-z0-9._-]*[A-Za-z0-9])?)\s*'
+                                   r'(?:\[(?P<extras>[^\]]*)\])?\s*@\s*'
+                                   r'(?P<url>\S+)'
+                                   r'(?:\s+;\s*(?P<marker>.*?))?\s*$')
+_REG_URL_WITH_MARKER = re.compile(r'^(?P<url>\S+)(?:\s+;\s*(?P<marker>.*?))?\s*$')
+_GITHUB_PREFIX = 'https://github.com/'
+# the lru cache of parse_link, see get_link_cache
+_link_cache = None                  # type: Any
+_link_cache_size = 0
+
+
+class PackageLink(NamedTuple):
+    """
+    the parsed package name or link - immutable, get it from parse_link
+
+    package_type: "pypy_package" | "git_package" | "weblink"
+    git_repository_slug: "owner/repository" for git packages, '' if it can not be determined
+    """
+    link: str
+    package_type: str
+    name: str = ''
+    extras: Tuple[str, ...] = ()
+    specifier: str = ''
+    marker: str = ''
+    url: str = ''
+    git_repository_slug: str = ''
+
+
+def parse_link(package_link: str) -> PackageLink:
+    """
+    parses a pip package name, a PEP 508 requirement or a link - the result is memoized by the link string, see get_link_cache
+
+    >>> parse_link('pip')
+    PackageLink(link='pip', package_type='pypy_package', name='pip', extras=(), specifier='', marker='', url='', git_repository_slug='')
+    >>> parse_link('').package_type
+    'pypy_package'
+    >>> parse_link('pip').link = 'changed'
+    Traceback (most recent call last):
+    ...
+    AttributeError: ...
+    >>> package_link = parse_link('requests[security, socks] ~= 2.22 ; python_version < "3.8"')
+    >>> package_link.package_type, package_link.name, package_link.extras, package_link.specifier, package_link.marker
+    ('pypy_package', 'requests', ('security', 'socks'), '~=2.22', 'python_version < "3.8"')
+    >>> parse_link('wheel (!=0.32.3,>0.30)').specifier
+    '!=0.32.3,>0.30'
+    >>> parse_link('git+https://github.com/pypa/pip.git@master#egg=pip').git_repository_slug
+    'pypa/pip'
+    >>> package_link = parse_link('pip @ git+https://github.com/pypa/pip.git ; python_version >= "3.5"')
+    >>> package_link.package_type, package_link.name, package_link.url, package_link.marker, package_link.git_repository_slug
+    ('git_package', 'pip', 'git+https://github.com/pypa/pip.git', 'python_version >= "3.5"', 'pypa/pip')
+    >>> parse_link('https://some_link/pypa/archive/master.zip').package_type
+    'weblink'
+    >>> parse_link('git+https:/github.com/pypa/pip.git').git_repository_slug
+    ''
+
+    >>> # no valid requirement - a local file or link
+    >>> parse_link('foo bar').package_type, parse_link('lib_regexp[').package_type, parse_link('C:\\\\x\\\\y.whl').package_type
+    ('weblink', 'weblink', 'weblink')
+    >>> parse_link('wheel (>=1.0').package_type, parse_link('wheel==').package_type, parse_link('./dist/wheel-0.32.3.whl').package_type
+    ('weblink', 'weblink', 'weblink')
+
+    >>> # memoized
+    >>> get_link_cache().cache_clear()
+    >>> assert parse_link('pip') is parse_link('pip')
+    >>> get_link_cache().cache_info().hits
+    1
+
+    >>> # property based corpus - every combination must round trip
+    >>> import itertools
+    >>> names = ['a', 'pip', 'lib_regexp', 'zope.interface', 'Py-YAML2']
+    >>> l_extras = [(), ('security',), ('security', 'socks')]
+    >>> specifiers = ['', '==1.0', '>=1.0', '<2', '>1', '<=2.0', '~=1.4.2', '!=1.3', '===1.0a1', '>=1.0,!=1.3,<2']
+    >>> markers = ['', 'python_version < "3.8"', 'sys_platform == "win32" and python_version >= "3.5"']
+    >>> for name, extras, specifier, marker in itertools.product(names, l_extras, specifiers, markers):
+    ...     requirement = name
+    ...     if extras:
+    ...         requirement += '[{}]'.format(','.join(extras))
+    ...     requirement += specifier
+    ...     if marker:
+    ...         requirement += '; ' + marker
+    ...     parsed = parse_link(requirement)
+    ...     assert parsed == (requirement, 'pypy_package', name, extras, specifier, marker, '', ''), requirement
+    ...     if specifier:
+    ...         assert parse_link(requirement.replace(specifier, '({})'.format(specifier))).specifier == specifier
+    ...     for invalid in (' bar', '[', ' ' + specifier + ' bar', '\\\\x.whl'):
+    ...         assert parse_link(name + invalid).package_type == 'weblink', name + invalid
+
+    """
+    return get_link_cache()(package_link)
+
+
+def get_link_cache() -> Callable[[str], PackageLink]:
+    """
+    :returns the memoized parser - created on first use with Config.link_cache_size, and created again when that was changed
+
+    >>> save_link_cache_size = Config.link_cache_size
+    >>> Config.link_cache_size = 2
+    >>> get_link_cache().cache_info().maxsize
+    2
+    >>> Config.link_cache_size = save_link_cache_size
+    >>> assert get_link_cache().cache_info().maxsize == Config.link_cache_size
+
+    """
+    global _link_cache, _link_cache_size
+    if _link_cache is None or _link_cache_size != Config.link_cache_size:
+        _link_cache = functools.lru_cache(maxsize=Config.link_cache_size)(_parse_link)
+        _link_cache_size = Config.link_cache_size
+    return _link_cache
+
+
+def _parse_link(package_link: str) -> PackageLink:
+    stripped_link = package_link.strip()
+    if not stripped_link:
+        return PackageLink(link=package_link, package_type='pypy_package')
+
+    match = _REG_DIRECT_REFERENCE.match(stripped_link)
+    if match and '://' in match.group('url'):
+        return _get_package_link_from_url(link=package_link, url=match.group('url'), name=match.group('name'),
+                                          extras=_get_extras(match.group('extras')), marker=match.group('marker') or '')
+
+    if '://' in stripped_link:
+        match = _REG_URL_WITH_MARKER.match(stripped_link)
+        if match:
+            return _get_package_link_from_url(link=package_link, url=match.group('url'), marker=match.group('marker') or '')
+
+    match = _REG_REQUIREMENT.match(stripped_link)
+    if match:
+        specifier = match.group('specifier') or ''
+        if specifier.startswith('('):
+            specifier = specifier[1:-1]
+        return PackageLink(link=package_link, package_type='pypy_package', name=match.group('name'), extras=_get_extras(match.group('extras')),
+                           specifier=re.sub(r'\s+', '', specifier), marker=match.group('marker') or '')
+
+    return _get_package_link_from_url(link=package_link, url=stripped_link)
+
+
+def _get_extras(extras: str) -> Tuple[str, ...]:
+    if not extras:
+        return ()
+    return tuple(extra.strip() for extra in extras.split(',') if extra.strip())
+
+
+def _get_package_link_from_url(link: str, url: str, name: str = '', extras: Tuple[str, ...] = (), marker: str = '') -> PackageLink:
+    if _GITHUB_PREFIX not in url:
+        return PackageLink(link=link, package_type='weblink', name=name, extras=extras, marker=marker, url=url)
+    return PackageLink(link=link, package_type='git_package', name=name, extras=extras, marker=marker, url=url,
+                       git_repository_slug=_get_git_repository_slug(url))
+
+
+def _get_git_repository_slug(url: str) -> str:
+    """
+    >>> _get_git_repository_slug('https://github.com/pypa/pip/archive/master.zip')
+    'pypa/pip'
+    >>> _get_git_repository_slug('https://github.com/pypa/pip')
+    'pypa/pip'
+    >>> _get_git_repository_slug('https://github.com/pypa')
+    ''
+    """
+    # https://github.com/pypa/pip.git | git+https://github.com/pypa/pip.git@master#egg=pip | https://github.com/pypa/pip/archive/master.zip
+    elements = url.split(_GITHUB_PREFIX, 1)[1].split('/')
+    if len(elements) < 2:
+        return ''
+    owner = elements[0]
+    repository = elements[1].split('#', 1)[0].split('@', 1)[0]
+    if repository.endswith('.git'):
+        repository = repository[:-len('.git')]
+    if not owner or not repository:
+        return ''
+    return '{owner}/{repository}'.format(owner=owner, repository=repository)
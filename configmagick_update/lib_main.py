@@ -1,49 +1,73 @@
 # STDLIB
 import logging
-import subprocess
 
 # OWN
-from configmagick_bash import lib_bash
 import lib_log_utils
-import lib_shell
 
 # PROJ
 try:
     from . import lib_helpers
+    from . import lib_updater
+    from .lib_updater import Updater
 except ImportError:                 # for local development
     import lib_helpers              # type: ignore # pragma: no cover
+    import lib_updater              # type: ignore # pragma: no cover
+    from lib_updater import Updater     # type: ignore # pragma: no cover
 
+logger = logging.getLogger()
 
-def pip_install(package_name: str, package_link: str, use_sudo: bool) -> bool:  # returns updated or not
-    return pip_update(package_name=package_name, package_link=package_link, use_sudo=use_sudo)
 
+def pip_install(package_name: str, package_link: str, use_sudo: bool,
+                precompile: bool = False, smoke_import: bool = False, run_id: str = '') -> bool:  # returns updated or not
+    return pip_update(package_name=package_name, package_link=package_link, use_sudo=use_sudo, precompile=precompile, smoke_import=smoke_import,
+                      run_id=run_id)
 
-def pip_update(package_name: str, package_link: str, use_sudo: bool) -> bool:  # returns updated or not
+
+def pip_update(package_name: str, package_link: str, use_sudo: bool,
+               precompile: bool = False, smoke_import: bool = False, run_id: str = '') -> bool:  # returns updated or not
     """
     Updates (or installs) pip packages also from git links, only if there is a new master, by storing and checking the git hashes
 
     name_or_link: name of the pip package or link to github
     sudo : pip install as root
+    precompile : precompile the python files of the updated package
+    smoke_import : import the top level modules of the updated package in a fresh interpreter, to verify the installation
+    run_id : the updates with the same run_id are rolled back together by rollback_last_run,
+             default the environment variable CONFIGMAGICK_UPDATE_RUN_ID, otherwise a new id for each call
 
     Returns updated - True if the Package was Updated, or False when it was not updated
+    raises ImportError if smoke_import is set and the updated package can not be imported
 
 
     """
 
-    updated = False
-    package_type = lib_helpers.get_package_type(package_link)
-    if package_type == 'pypy_package':
-        updated = pip_update_from_pypy(package_name_or_link=package_name, use_sudo=use_sudo)
-    elif package_type == 'git_package':
-        if not is_pip_git_package_up_to_date(package_name=package_name, package_link=package_link):
-            updated = pip_update_from_git(package_link=package_link, use_sudo=use_sudo)     # returns always true, but we do it only when update is needed
-    elif package_type == 'weblink':
-        pip_update_from_weblink(package_link=package_link, use_sudo=use_sudo)
-        updated = True
-    else:
-        updated = False
+    updater = Updater(use_sudo=use_sudo, precompile=precompile, smoke_import=smoke_import, run_id=run_id)
+    result = updater.update(package_name=package_name, package_link=package_link)
+    if result.warmup is not None and result.warmup.failed_imports:
+        error = 'Package "{package_name}" was updated, but the smoke import failed for: {modules}'\
+            .format(package_name=package_name, modules=', '.join(result.warmup.failed_imports))
+        lib_log_utils.banner_error(error)
+        raise ImportError(error)
+    return result.updated
+
+
+def rollback(package_name: str, use_sudo: bool) -> bool:
+    """
+    reinstalls the previous version of the package from the local rollback snapshot, without downloading
+
+    raises FileNotFoundError if there is no snapshot of the package
+    """
+    return Updater(use_sudo=use_sudo).rollback(package_name=package_name).updated
 
-    return updated
+
+def rollback_last_run(use_sudo: bool) -> bool:
+    """
+    reinstalls the previous versions of all packages updated by the last run, from the local rollback snapshots.
+    the snapshots are removed after the rollback, so each call steps one run further back
+
+    raises FileNotFoundError if there are no snapshots
+    """
+    return bool(Updater(use_sudo=use_sudo).rollback_last_run())
 
 
 def pip_update_from_pypy(package_name_or_link: str, use_sudo: bool, show_output: bool = True) -> bool:
@@ -57,21 +81,7 @@ def pip_update_from_pypy(package_name_or_link: str, use_sudo: bool, show_output:
     >>> assert pip_update_from_pypy('chardet', use_sudo=True, show_output=False) is not None            # third Update - is already up to date
 
     """
-    try:
-        pip_command = lib_helpers.get_latest_pip_command().command_string
-        ls_commands = lib_helpers.get_ls_commands_prepend_sudo([pip_command, "install", "--upgrade", package_name_or_link], use_sudo=use_sudo)
-        shell_response = lib_shell.run_shell_ls_command(ls_commands, pass_std_out_line_by_line=show_output)
-        if "Requirement already up-to-date: {pypy_package}".format(pypy_package=package_name_or_link) in shell_response.stdout:
-            return False
-        else:
-            return True
-    except subprocess.CalledProcessError as exc:
-        if exc.returncode == 13:   # pip permission error
-            raise PermissionError(exc.stderr)
-        else:
-            error = 'Package "{pypy_package}" can not be installed via pip:\n\n{stderr}'.format(pypy_package=package_name_or_link, stderr=exc.stderr)
-            lib_log_utils.banner_error(error)
-            raise ValueError(error)
+    return Updater(use_sudo=use_sudo, show_output=show_output).pip_install_upgrade(package_name_or_link=package_name_or_link)
 
 
 def pip_update_from_git(package_link: str, use_sudo: bool, show_output: bool = True) -> bool:
@@ -83,10 +93,10 @@ def pip_update_from_git(package_link: str, use_sudo: bool, show_output: bool = T
 
     """
 
-    updated = pip_update_from_pypy(package_name_or_link=package_link, use_sudo=use_sudo, show_output=show_output)
+    updater = Updater(use_sudo=use_sudo, show_output=show_output)
+    updated = updater.pip_install_upgrade(package_name_or_link=package_link)
     git_repository_slug = lib_helpers.get_git_repository_slug_from_link(package_link=package_link)
-    git_remote_hash = lib_helpers.get_git_remote_hash(git_repository_slug=git_repository_slug)
-    lib_helpers.save_git_hash_to_database(key=package_link, git_hash=git_remote_hash)
+    updater.save_git_hash(key=package_link, git_hash=updater.get_git_remote_hash(git_repository_slug=git_repository_slug))
     return updated
 
 
@@ -98,18 +108,8 @@ def is_pip_git_package_up_to_date(package_name: str, package_link: str) -> bool:
     """
     >>> import unittest
     >>> result = pip_update_from_git('git+https://github.com/bitranox/lib_doctest_pycharm.git',use_sudo=True, show_output=False)
-    >>> assert lib_helpers.is_pip_package_installed('lib_doctest_pycharm') == True
+    >>> assert Updater().get_installed_version('lib_doctest_pycharm') != ''
     >>> assert is_pip_git_package_up_to_date('lib_doctest_pycharm', 'git+https://github.com/bitranox/lib_doctest_pycharm.git') == True
 
     """
-    if not lib_helpers.is_pip_package_installed(package_name):
-        return False
-
-    git_repository_slug = lib_helpers.get_git_repository_slug_from_link(package_link=package_link)
-    git_remote_hash = lib_helpers.get_git_remote_hash(git_repository_slug=git_repository_slug)
-    git_local_hash = lib_helpers.get_git_local_hash_from_database_or_blank(key=package_link)
-
-    if git_remote_hash != git_local_hash:
-        return False
-    else:
-        return True
+    return Updater().check(package_name=package_name, package_link=package_link).action == lib_updater.ACTION_UP_TO_DATE
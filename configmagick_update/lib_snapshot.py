@@ -0,0 +1,392 @@
+# STDLIB
+import base64
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import shutil
+import stat
+import subprocess
+import tempfile
+import time
+import zipfile
+from typing import Dict, List, NamedTuple, Set, Tuple
+
+# PROJ
+try:
+    from . import lib_helpers
+    from . import lib_stream
+    from . import lib_warmup
+    from .config import Config
+except ImportError:                 # for local development
+    import lib_helpers              # type: ignore # pragma: no cover
+    import lib_stream               # type: ignore # pragma: no cover
+    import lib_warmup               # type: ignore # pragma: no cover
+    from config import Config       # type: ignore # pragma: no cover
+
+logger = logging.getLogger()
+
+
+class Snapshot(NamedTuple):
+    """
+    the wheel of the previous version of a package, and the git hash stored for it in the version store
+
+    version_key: the key in the version store (the git link), '' if the package is not a git package
+    git_hash: the previous git hash in the version store, '' if there was none
+    run_id: the Updater session that took the snapshot
+    """
+    package_name: str
+    version: str
+    path_wheel: str
+    size: int
+    version_key: str = ''
+    git_hash: str = ''
+    run_id: str = ''
+    created: float = 0.0
+
+
+def create_snapshot(package_name: str, pip_command_str: str, version_key: str = '', git_hash: str = '') -> Snapshot:
+    """
+    packs the installed files of the package into a wheel in a pending directory - see commit_snapshot and discard_snapshot.
+    raises ValueError if the package was not installed from a wheel (no .dist-info)
+
+    """
+    location, files = lib_warmup.get_distribution_files(package_name=package_name, pip_command_str=pip_command_str)
+    scheme_paths = None     # type: Dict[str, str]
+    if any(file.startswith('..') for file in files):
+        scheme_paths = get_scheme_paths(python_command_str=lib_warmup.get_python_command_of_pip(pip_command_str), location=location)
+    Config.path_snapshots_dir.mkdir(mode=0o775, parents=True, exist_ok=True)
+    path_pending_dir = pathlib.Path(tempfile.mkdtemp(prefix='pending_', dir=str(Config.path_snapshots_dir)))
+    try:
+        path_wheel = build_wheel_from_installed_files(location=location, files=files, path_target_dir=path_pending_dir, scheme_paths=scheme_paths)
+    except Exception:
+        shutil.rmtree(str(path_pending_dir), ignore_errors=True)
+        raise
+    return Snapshot(package_name=lib_helpers.get_normalized_package_name(package_name),
+                    version=path_wheel.name.split('-')[1],
+                    path_wheel=str(path_wheel),
+                    size=path_wheel.stat().st_size,
+                    version_key=version_key,
+                    git_hash=git_hash)
+
+
+def build_wheel_from_installed_files(location: pathlib.Path, files: List[str], path_target_dir: pathlib.Path,
+                                     scheme_paths: Dict[str, str] = None) -> pathlib.Path:
+    """
+    :returns the path of the wheel, built from the installed files (relative to location). bytecode is left out.
+    files outside of location are packed into <dist>.data/scripts (in the scripts directory) or <dist>.data/data (below the data directory),
+    scheme_paths has the "scripts" and "data" directories of the installation, see get_scheme_paths.
+    console and gui scripts are left out, pip creates them again from the entry points.
+    raises ValueError if the package has no .dist-info, or a file outside of location can not be packed
+
+    >>> import subprocess, sys
+    >>> with tempfile.TemporaryDirectory() as tmp_dir:
+    ...     path_prefix = pathlib.Path(tmp_dir) / 'prefix'
+    ...     location = path_prefix / 'lib/site-packages'
+    ...     (location / 'my_package').mkdir(parents=True)
+    ...     (location / 'my_package-1.0.dist-info').mkdir()
+    ...     (path_prefix / 'bin').mkdir()
+    ...     (path_prefix / 'share/my_package').mkdir(parents=True)
+    ...     _ = (location / 'my_package/__init__.py').write_text('a = 1\\n')
+    ...     _ = (location / 'my_package-1.0.dist-info/METADATA').write_text('Metadata-Version: 2.1\\nName: my_package\\nVersion: 1.0\\n')
+    ...     wheel_metadata = 'Wheel-Version: 1.0\\nRoot-Is-Purelib: true\\nTag: py2-none-any\\nTag: py3-none-any\\n'
+    ...     _ = (location / 'my_package-1.0.dist-info/WHEEL').write_text(wheel_metadata)
+    ...     _ = (location / 'my_package-1.0.dist-info/entry_points.txt').write_text('[console_scripts]\\nmy_package = my_package:main\\n')
+    ...     _ = (location / 'my_package-1.0.dist-info/RECORD').write_text('')
+    ...     _ = (path_prefix / 'bin/my_package').write_text('#!/usr/bin/python\\n')
+    ...     _ = (path_prefix / 'bin/my_script').write_text('#!/bin/sh\\n')
+    ...     _ = (path_prefix / 'share/my_package/my_data.txt').write_text('data\\n')
+    ...     files = ['my_package/__init__.py', 'my_package/__pycache__/__init__.cpython-37.pyc', 'my_package-1.0.dist-info/METADATA',
+    ...              'my_package-1.0.dist-info/WHEEL', 'my_package-1.0.dist-info/entry_points.txt', 'my_package-1.0.dist-info/RECORD',
+    ...              '../../bin/my_package', '../../bin/my_script', '../../share/my_package/my_data.txt']
+    ...     scheme_paths = {'scripts': str(path_prefix / 'bin'), 'data': str(path_prefix)}
+    ...     path_wheel = build_wheel_from_installed_files(location, files, pathlib.Path(tmp_dir), scheme_paths)
+    ...     print(path_wheel.name)
+    ...     with zipfile.ZipFile(str(path_wheel)) as wheel:
+    ...         print(wheel.namelist())
+    ...         print(wheel.read('my_package-1.0.dist-info/RECORD').decode().splitlines()[-1])
+    ...     # the snapshot installs on this platform, with the script and the data file
+    ...     path_restore = pathlib.Path(tmp_dir) / 'restore'
+    ...     ls_commands = [sys.executable, '-m', 'pip', 'install', '--quiet', '--no-index', '--no-deps', '--prefix', str(path_restore), str(path_wheel)]
+    ...     _ = subprocess.run(ls_commands, stderr=subprocess.PIPE, check=True)
+    ...     assert (path_restore / 'bin/my_script').exists() and (path_restore / 'share/my_package/my_data.txt').exists()
+    ...     assert (path_restore / 'bin/my_package').exists()     # created from the entry point
+    my_package-1.0-py2.py3-none-any.whl
+    ['my_package/__init__.py', 'my_package-1.0.dist-info/METADATA', 'my_package-1.0.dist-info/WHEEL', 'my_package-1.0.dist-info/entry_points.txt', \
+'my_package-1.0.data/scripts/my_script', 'my_package-1.0.data/data/share/my_package/my_data.txt', 'my_package-1.0.dist-info/RECORD']
+    my_package-1.0.dist-info/RECORD,,
+
+    >>> import unittest
+    >>> unittest.TestCase().assertRaises(ValueError, build_wheel_from_installed_files, location, files, pathlib.Path(), None)
+
+    """
+    l_dist_info_dirs = sorted({pathlib.PurePosixPath(file).parts[0] for file in files if pathlib.PurePosixPath(file).parts[0].endswith('.dist-info')})
+    if not l_dist_info_dirs:
+        raise ValueError('the package in "{location}" has no .dist-info, it can not be packed into a wheel'.format(location=location))
+    dist_info_dir = l_dist_info_dirs[0]
+    distribution, version = dist_info_dir[:-len('.dist-info')].rsplit('-', 1)
+    record_file = '{dist_info_dir}/RECORD'.format(dist_info_dir=dist_info_dir)
+    data_dir = '{distribution}-{version}.data'.format(distribution=distribution, version=version)
+
+    l_tags = list()                 # type: List[str]
+    path_wheel_metadata = location / dist_info_dir / 'WHEEL'
+    if path_wheel_metadata.exists():
+        l_tags = [line.split(':', 1)[1].strip() for line in path_wheel_metadata.read_text().splitlines() if line.startswith('Tag:')]
+    tag = get_compressed_tag_set(l_tags or ['py3-none-any'])
+
+    # the files in the wheel: (the installed file, the name in the wheel)
+    l_wheel_files = list()          # type: List[Tuple[pathlib.Path, str]]
+    script_names = get_entry_point_script_names(location / dist_info_dir / 'entry_points.txt')
+    # "pip show -f" might list a file twice
+    for file in dict.fromkeys(files):
+        if file == record_file or '__pycache__' in file or file.endswith('.pyc'):
+            continue
+        if not file.startswith('..'):
+            l_wheel_files.append((location / file, file))
+            continue
+        path_file = pathlib.Path(os.path.normpath(str(location / file)))
+        if scheme_paths is None:
+            raise ValueError('the file "{file}" of "{distribution}" is outside of "{location}", and the installation scheme is unknown - '
+                             'it can not be packed into a wheel'.format(file=path_file, distribution=distribution, location=location))
+        path_scripts_dir = pathlib.Path(os.path.normpath(scheme_paths['scripts']))
+        path_data_dir = pathlib.Path(os.path.normpath(scheme_paths['data']))
+        if path_file.parent == path_scripts_dir:
+            if _get_script_name(path_file.name) in script_names:
+                continue
+            l_wheel_files.append((path_file, '{data_dir}/scripts/{name}'.format(data_dir=data_dir, name=path_file.name)))
+        elif path_data_dir in path_file.parents:
+            # data_files and headers - installed again below the data directory (the prefix)
+            l_wheel_files.append((path_file, '{data_dir}/data/{name}'.format(data_dir=data_dir, name=path_file.relative_to(path_data_dir).as_posix())))
+        else:
+            raise ValueError('the file "{file}" of "{distribution}" is outside of the installation scheme, '
+                             'it can not be packed into a wheel'.format(file=path_file, distribution=distribution))
+
+    path_wheel = path_target_dir / '{distribution}-{version}-{tag}.whl'.format(distribution=distribution, version=version, tag=tag)
+    l_record_lines = list()         # type: List[str]
+    with zipfile.ZipFile(str(path_wheel), mode='w', compression=zipfile.ZIP_DEFLATED) as wheel:
+        for path_file, name in l_wheel_files:
+            data = path_file.read_bytes()
+            zip_info = zipfile.ZipInfo(name, date_time=time.localtime(path_file.stat().st_mtime)[:6])
+            zip_info.compress_type = zipfile.ZIP_DEFLATED
+            # keeps the executable bit of the scripts
+            zip_info.external_attr = (stat.S_IFREG | stat.S_IMODE(path_file.stat().st_mode)) << 16
+            wheel.writestr(zip_info, data)
+            digest = base64.urlsafe_b64encode(hashlib.sha256(data).digest()).rstrip(b'=').decode()
+            l_record_lines.append('{name},sha256={digest},{size}'.format(name=name, digest=digest, size=len(data)))
+        l_record_lines.append('{record_file},,'.format(record_file=record_file))
+        wheel.writestr(record_file, '\n'.join(l_record_lines) + '\n')
+    return path_wheel
+
+
+def get_compressed_tag_set(l_tags: List[str]) -> str:
+    """
+    :returns the compressed tag set of the wheel file name (PEP 425), from the "Tag:" lines of the WHEEL file
+
+    >>> get_compressed_tag_set(['py2-none-any', 'py3-none-any'])
+    'py2.py3-none-any'
+    >>> get_compressed_tag_set(['cp37-cp37m-manylinux1_x86_64', 'cp37-cp37m-manylinux2010_x86_64'])
+    'cp37-cp37m-manylinux1_x86_64.manylinux2010_x86_64'
+
+    """
+    l_l_parts = [list(), list(), list()]      # type: List[List[str]]
+    for tag in l_tags:
+        for l_parts, part in zip(l_l_parts, tag.split('-', 2)):
+            if part not in l_parts:
+                l_parts.append(part)
+    return '-'.join('.'.join(l_parts) for l_parts in l_l_parts)
+
+
+def get_entry_point_script_names(path_entry_points_file: pathlib.Path) -> Set[str]:
+    """
+    :returns the names of the console and gui scripts - pip creates them from the entry points
+
+    >>> with tempfile.TemporaryDirectory() as tmp_dir:
+    ...     path_entry_points_file = pathlib.Path(tmp_dir) / 'entry_points.txt'
+    ...     _ = path_entry_points_file.write_text('[console_scripts]\\npip = pip:main\\npip3=pip:main\\n\\n[other]\\nx = y:z\\n')
+    ...     sorted(get_entry_point_script_names(path_entry_points_file))
+    ['pip', 'pip3']
+
+    """
+    script_names = set()            # type: Set[str]
+    if not path_entry_points_file.exists():
+        return script_names
+    section = ''
+    for line in path_entry_points_file.read_text().splitlines():
+        line = line.strip()
+        if line.startswith('['):
+            section = line.strip('[]').strip()
+        elif '=' in line and section in ('console_scripts', 'gui_scripts'):
+            script_names.add(line.split('=', 1)[0].strip())
+    return script_names
+
+
+def _get_script_name(file_name: str) -> str:
+    """ the name of the entry point, from the name of the script - on windows "pip.exe" or "pip-script.py" """
+    for suffix in ('.exe', '-script.pyw', '-script.py'):
+        if file_name.endswith(suffix):
+            return file_name[:-len(suffix)]
+    return file_name
+
+
+# prints the "scripts" and "data" directories of the installation scheme of the location (site-packages), or {}
+_SCHEME_SCRIPT = """
+import json, os, sys, sysconfig
+location = os.path.normcase(os.path.realpath(sys.argv[1]))
+scheme_paths = dict()
+for scheme in sysconfig.get_scheme_names():
+    try:
+        paths = sysconfig.get_paths(scheme)
+    except KeyError:
+        continue
+    if location in (os.path.normcase(os.path.realpath(paths.get(key, ''))) for key in ('purelib', 'platlib')):
+        scheme_paths = {'scripts': paths['scripts'], 'data': paths['data']}
+        break
+print(json.dumps(scheme_paths))
+"""
+
+
+def get_scheme_paths(python_command_str: str, location: pathlib.Path) -> Dict[str, str]:
+    """
+    :returns the "scripts" and "data" directories of the installation (site-packages) location, from sysconfig of the python interpreter.
+    None if the location is not part of a known installation scheme
+
+    >>> import sys, sysconfig
+    >>> assert get_scheme_paths(sys.executable, pathlib.Path(sysconfig.get_paths()['purelib']))['scripts'] == sysconfig.get_paths()['scripts']
+    >>> assert get_scheme_paths(sys.executable, pathlib.Path('/not/a/site-packages')) is None
+
+    """
+    try:
+        output = lib_stream.grep_first(lib_stream.ShellLineStream([python_command_str, '-c', _SCHEME_SCRIPT, str(location)]), '^{')
+        scheme_paths = json.loads(output)
+    except (subprocess.CalledProcessError, OSError, ValueError) as exc:
+        logger.warning('can not get the installation scheme of "{location}": {exc}'.format(location=location, exc=exc))
+        return None
+    return scheme_paths or None
+
+
+def commit_snapshot(snapshot: Snapshot, run_id: str) -> Snapshot:
+    """
+    moves the pending snapshot into the store, replacing the former snapshot of the package,
+    and removes the oldest snapshots if the store gets bigger than Config.snapshots_max_bytes
+    """
+    path_pending_wheel = pathlib.Path(snapshot.path_wheel)
+    path_package_dir = Config.path_snapshots_dir / snapshot.package_name
+    remove_stale_pending_dirs()
+    snapshot_index = load_snapshot_index()
+    if snapshot.package_name in snapshot_index:
+        _remove_snapshot_files(snapshot_index.pop(snapshot.package_name))
+    path_package_dir.mkdir(mode=0o775, parents=True, exist_ok=True)
+    path_wheel = path_package_dir / path_pending_wheel.name
+    path_pending_wheel.replace(path_wheel)
+    shutil.rmtree(str(path_pending_wheel.parent), ignore_errors=True)
+
+    snapshot = snapshot._replace(path_wheel=str(path_wheel), run_id=run_id, created=time.time())
+    snapshot_index[snapshot.package_name] = snapshot
+
+    # remove the oldest snapshots, but always keep the new one
+    l_snapshots_oldest_first = sorted(snapshot_index.values(), key=lambda snapshot_in_index: snapshot_in_index.created)
+    total_size = sum(snapshot_in_index.size for snapshot_in_index in l_snapshots_oldest_first)
+    for snapshot_in_index in l_snapshots_oldest_first[:-1]:
+        if total_size <= Config.snapshots_max_bytes:
+            break
+        logger.info('removing the rollback snapshot of "{package_name}" {version}'.format(package_name=snapshot_in_index.package_name,
+                                                                                       version=snapshot_in_index.version))
+        _remove_snapshot_files(snapshot_index.pop(snapshot_in_index.package_name))
+        total_size -= snapshot_in_index.size
+
+    save_snapshot_index(snapshot_index)
+    return snapshot
+
+
+def remove_stale_pending_dirs() -> None:
+    """
+    removes the pending directories older than Config.snapshot_pending_max_seconds, left behind by crashed runs
+
+    >>> save_path_snapshots_dir = Config.path_snapshots_dir
+    >>> with tempfile.TemporaryDirectory() as tmp_dir:
+    ...     Config.path_snapshots_dir = pathlib.Path(tmp_dir)
+    ...     path_stale_dir = pathlib.Path(tempfile.mkdtemp(prefix='pending_', dir=tmp_dir))
+    ...     path_active_dir = pathlib.Path(tempfile.mkdtemp(prefix='pending_', dir=tmp_dir))
+    ...     stale_time = time.time() - Config.snapshot_pending_max_seconds - 1
+    ...     os.utime(str(path_stale_dir), (stale_time, stale_time))
+    ...     remove_stale_pending_dirs()
+    ...     assert not path_stale_dir.exists() and path_active_dir.exists()
+    >>> Config.path_snapshots_dir = save_path_snapshots_dir
+
+    """
+    if not Config.path_snapshots_dir.exists():
+        return
+    oldest_mtime = time.time() - Config.snapshot_pending_max_seconds
+    for path_pending_dir in Config.path_snapshots_dir.glob('pending_*'):
+        try:
+            if path_pending_dir.is_dir() and path_pending_dir.stat().st_mtime < oldest_mtime:
+                logger.info('removing the stale pending snapshot "{path}"'.format(path=path_pending_dir))
+                shutil.rmtree(str(path_pending_dir), ignore_errors=True)
+        except OSError:
+            pass
+
+
+def discard_snapshot(snapshot: Snapshot) -> None:
+    """ removes a pending snapshot """
+    shutil.rmtree(str(pathlib.Path(snapshot.path_wheel).parent), ignore_errors=True)
+
+
+def remove_snapshot(package_name: str) -> None:
+    snapshot_index = load_snapshot_index()
+    snapshot = snapshot_index.pop(lib_helpers.get_normalized_package_name(package_name), None)
+    if snapshot is not None:
+        _remove_snapshot_files(snapshot)
+        save_snapshot_index(snapshot_index)
+
+
+def _remove_snapshot_files(snapshot: Snapshot) -> None:
+    path_wheel = pathlib.Path(snapshot.path_wheel)
+    if path_wheel.exists():
+        path_wheel.unlink()
+
+
+def get_snapshot(package_name: str) -> Snapshot:
+    """
+    raises FileNotFoundError if there is no snapshot of the package
+    """
+    snapshot = load_snapshot_index().get(lib_helpers.get_normalized_package_name(package_name))
+    if snapshot is None or not pathlib.Path(snapshot.path_wheel).exists():
+        raise FileNotFoundError('there is no rollback snapshot of package "{package_name}"'.format(package_name=package_name))
+    return snapshot
+
+
+def get_snapshots_of_last_run() -> List[Snapshot]:
+    """
+    raises FileNotFoundError if there are no snapshots
+    """
+    snapshot_index = load_snapshot_index()
+    if not snapshot_index:
+        raise FileNotFoundError('there are no rollback snapshots')
+    last_run_id = max(snapshot_index.values(), key=lambda snapshot: snapshot.created).run_id
+    return [snapshot for snapshot in snapshot_index.values() if snapshot.run_id == last_run_id]
+
+
+def load_snapshot_index() -> Dict[str, Snapshot]:
+    """
+    >>> save_path_snapshot_index_file = Config.path_snapshot_index_file
+    >>> Config.path_snapshot_index_file = Config.path_version_files_dir / 'test_snapshots.dat'
+    >>> snapshot = Snapshot('pip', '19.2', '/tmp/pip-19.2-py3-none-any.whl', 1000, run_id='1', created=1.0)
+    >>> save_snapshot_index({'pip': snapshot})
+    >>> assert load_snapshot_index() == {'pip': snapshot}
+    >>> Config.path_snapshot_index_file.unlink()
+    >>> assert load_snapshot_index() == dict()
+    >>> Config.path_snapshot_index_file = save_path_snapshot_index_file
+
+    """
+    if not Config.path_snapshot_index_file.exists():
+        return dict()
+    with open(str(Config.path_snapshot_index_file), 'r') as f:
+        snapshot_index_raw = json.load(f)
+    return {package_name: Snapshot(**snapshot_raw) for package_name, snapshot_raw in snapshot_index_raw.items()}
+
+
+def save_snapshot_index(snapshot_index: Dict[str, Snapshot]) -> None:
+    Config.path_snapshot_index_file.parent.mkdir(mode=0o775, parents=True, exist_ok=True)
+    lib_helpers.save_json_atomic(path_json_file=Config.path_snapshot_index_file,
+                                 data={package_name: snapshot._asdict() for package_name, snapshot in snapshot_index.items()})
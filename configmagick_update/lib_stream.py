@@ -0,0 +1,139 @@
+# STDLIB
+import collections
+import logging
+import re
+import subprocess
+import sys
+import threading
+from typing import Deque, IO, Iterable, Iterator, List, Union
+
+# PROJ
+try:
+    from .config import Config
+except ImportError:                 # for local development
+    from config import Config       # type: ignore # pragma: no cover
+
+logger = logging.getLogger()
+
+
+class ShellLineStream(object):
+    """
+    runs a shell command and yields its stdout line by line, without keeping the whole output in memory.
+    only the last <tail_lines> lines of stdout and stderr are kept, for error reports (default Config.stream_tail_lines).
+    if the consumer stops iterating early, the process is killed - use that only for read-only commands.
+    if the command finishes with a returncode != 0, subprocess.CalledProcessError is raised,
+    with the bounded tails as output and stderr
+
+    >>> stream = ShellLineStream([sys.executable, '-c', 'for i in range(100000): print(i)'], tail_lines=3)
+    >>> grep_first(stream, '^42$')
+    '42'
+    >>> assert len(stream.stdout_tail) <= 3
+
+    >>> stream = ShellLineStream([sys.executable, '-c', 'for i in range(100000): print(i)'], tail_lines=3)
+    >>> contains_text(stream, '99999')
+    True
+    >>> list(stream.stdout_tail)
+    ['99997', '99998', '99999']
+
+    >>> import unittest
+    >>> stream = ShellLineStream([sys.executable, '-c', 'import sys; print("out"); sys.exit("error")'])
+    >>> unittest.TestCase().assertRaises(subprocess.CalledProcessError, list, stream)
+    >>> list(stream.stderr_tail)
+    ['error']
+
+    """
+
+    def __init__(self, ls_commands: List[str], tail_lines: int = None, pass_std_out_line_by_line: bool = False) -> None:
+        if tail_lines is None:
+            tail_lines = Config.stream_tail_lines
+        self.ls_commands = ls_commands
+        self.pass_std_out_line_by_line = pass_std_out_line_by_line
+        self.stdout_tail = collections.deque(maxlen=tail_lines)     # type: Deque[str]
+        self.stderr_tail = collections.deque(maxlen=tail_lines)     # type: Deque[str]
+        self.returncode = None                                      # type: int
+
+    def __iter__(self) -> Iterator[str]:
+        process = subprocess.Popen(self.ls_commands, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+        # stderr is drained in a thread, otherwise a full stderr pipe would block the process
+        stderr_thread = threading.Thread(target=_drain_to_tail, args=(process.stderr, self.stderr_tail), daemon=True)
+        stderr_thread.start()
+        finished = False
+        try:
+            for line in process.stdout:
+                line = line.rstrip('\r\n')
+                self.stdout_tail.append(line)
+                if self.pass_std_out_line_by_line:
+                    sys.stdout.write(line + '\n')
+                yield line
+            finished = True
+        finally:
+            if not finished:
+                process.kill()
+            process.stdout.close()
+            self.returncode = process.wait()
+            stderr_thread.join()
+            process.stderr.close()
+
+        if self.returncode != 0:
+            raise subprocess.CalledProcessError(returncode=self.returncode,
+                                                cmd=self.ls_commands,
+                                                output='\n'.join(self.stdout_tail),
+                                                stderr='\n'.join(self.stderr_tail))
+
+
+def _drain_to_tail(stream: IO[str], tail: Deque[str]) -> None:
+    for line in stream:
+        tail.append(line.rstrip('\r\n'))
+
+
+def grep_first(lines: Iterable[str], pattern: str) -> str:
+    """
+    :returns the first line matching the regexp pattern, or '' if not found.
+    stops reading the lines as soon as the line is found
+
+    >>> consumed = list()
+    >>> def synthetic_lines(n):
+    ...     for i in range(n):
+    ...         consumed.append(i)
+    ...         yield '{i:040x}\\trefs/heads/branch_{i}'.format(i=i)
+    >>> grep_first(synthetic_lines(100000), 'branch_10$')
+    '000000000000000000000000000000000000000a\\trefs/heads/branch_10'
+    >>> len(consumed)
+    11
+    >>> grep_first(synthetic_lines(100000), 'not_there')
+    ''
+
+    """
+    reg_pattern = re.compile(pattern)
+    for line in lines:
+        if reg_pattern.search(line):
+            return line
+    return ''
+
+
+def contains_text(lines: Iterable[str], text: Union[str, List[str]]) -> bool:
+    """
+    :returns True if any line contains the text (or one of the texts).
+    reads all lines to the end, so a running process is never interrupted
+
+    >>> consumed = list()
+    >>> def synthetic_lines(n):
+    ...     for i in range(n):
+    ...         consumed.append(i)
+    ...         yield 'Collecting package_{i}'.format(i=i)
+    >>> contains_text(synthetic_lines(100000), 'package_5')
+    True
+    >>> len(consumed)
+    100000
+    >>> contains_text(synthetic_lines(10), 'not_there')
+    False
+    >>> contains_text(synthetic_lines(10), ['not_there', 'package_9'])
+    True
+
+    """
+    l_texts = [text] if isinstance(text, str) else text
+    found = False
+    for line in lines:
+        if not found and any(text_to_find in line for text_to_find in l_texts):
+            found = True
+    return found
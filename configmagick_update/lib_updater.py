@@ -0,0 +1,415 @@
+# STDLIB
+import datetime
+import json
+import logging
+import os
+import subprocess
+import time
+from typing import Dict, Iterable, List, NamedTuple, Tuple
+
+# OWN
+from configmagick_bash import lib_bash
+import lib_log_utils
+
+# PROJ
+try:
+    from . import lib_helpers
+    from . import lib_snapshot
+    from . import lib_stream
+    from . import lib_warmup
+except ImportError:                 # for local development
+    import lib_helpers              # type: ignore # pragma: no cover
+    import lib_snapshot             # type: ignore # pragma: no cover
+    import lib_stream               # type: ignore # pragma: no cover
+    import lib_warmup               # type: ignore # pragma: no cover
+
+logger = logging.getLogger()
+
+# actions reported by Updater.check
+ACTION_NOT_INSTALLED = 'not_installed'
+ACTION_UPDATE_AVAILABLE = 'update_available'
+ACTION_UNKNOWN = 'unknown'                      # pypy packages and weblinks - only pip knows if there is an update
+# actions reported by Updater.check and Updater.update
+ACTION_UP_TO_DATE = 'up_to_date'
+# actions reported by Updater.update
+ACTION_INSTALLED = 'installed'
+ACTION_UPDATED = 'updated'
+ACTION_FAILED = 'failed'
+# actions reported by Updater.rollback
+ACTION_ROLLED_BACK = 'rolled_back'
+
+
+class PackageResult(NamedTuple):
+    """
+    the result of Updater.check or Updater.update for one package.
+    old_version and new_version are the git hashes for git packages, otherwise the installed pip versions ('' if not installed)
+    warmup is the result of the post install stage, None if the stage did not run for the package
+
+    >>> result = PackageResult('pip', '', 'pypy_package', ACTION_UPDATED, '19.1', '19.2', 0.1, 2.5)
+    >>> assert result.updated
+    >>> result = result._replace(action=ACTION_UP_TO_DATE)
+    >>> assert not result.updated
+
+    """
+    package_name: str
+    package_link: str
+    package_type: str
+    action: str
+    old_version: str = ''
+    new_version: str = ''
+    check_seconds: float = 0.0
+    update_seconds: float = 0.0
+    error: str = ''
+    warmup: lib_warmup.WarmupResult = None
+
+    @property
+    def updated(self) -> bool:
+        return self.action in (ACTION_INSTALLED, ACTION_UPDATED, ACTION_ROLLED_BACK)
+
+
+class Updater(object):
+    """
+    an update session - the pip / git / sudo commands, the index of installed packages,
+    the git remote hashes and the version store are looked up only once and shared by all calls.
+    precompile / smoke_import enable the post install stage for the updated packages, see lib_warmup.warmup_packages.
+    snapshot keeps the wheel of the previous version of updated packages, for rollback.
+    run_id groups the snapshots for rollback_last_run - sessions (or processes) with the same run_id are one run.
+    the default is the environment variable CONFIGMAGICK_UPDATE_RUN_ID, otherwise a new id for every session
+
+    >>> updater = Updater(use_sudo=True, show_output=False)
+    >>> results = updater.check_many([('pip', ''), ('lib_doctest_pycharm', 'git+https://github.com/bitranox/lib_doctest_pycharm.git')])
+    >>> assert results[0].action in (ACTION_NOT_INSTALLED, ACTION_UNKNOWN)
+    >>> results = updater.update_many([('lib_doctest_pycharm', 'git+https://github.com/bitranox/lib_doctest_pycharm.git')])
+    >>> assert results[0].action in (ACTION_INSTALLED, ACTION_UPDATED, ACTION_UP_TO_DATE)
+    >>> assert updater.check('lib_doctest_pycharm', 'git+https://github.com/bitranox/lib_doctest_pycharm.git').action == ACTION_UP_TO_DATE
+    >>> assert updater.update('lib_doctest_pycharm', 'git+https://github.com/bitranox/lib_doctest_pycharm.git').action == ACTION_UP_TO_DATE
+
+    """
+
+    def __init__(self, use_sudo: bool = False, show_output: bool = True, precompile: bool = False, smoke_import: bool = False,
+                 snapshot: bool = True, run_id: str = '') -> None:
+        self.use_sudo = use_sudo
+        self.show_output = show_output
+        self.precompile = precompile
+        self.smoke_import = smoke_import
+        self.snapshot = snapshot
+        self.run_id = run_id or os.environ.get('CONFIGMAGICK_UPDATE_RUN_ID', '') or datetime.datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+        self._pip_command_str = ''
+        self._git_command_str = ''
+        self._sudo_command_str = None               # type: str
+        self._installed_index = None                # type: Dict[str, str]
+        self._version_store = None                  # type: Dict[str, str]
+        self._git_remote_hashes = dict()            # type: Dict[str, str]
+
+    # cached probes
+
+    def get_pip_command_str(self) -> str:
+        if not self._pip_command_str:
+            self._pip_command_str = str(lib_helpers.get_latest_pip_command().command_string)
+        return self._pip_command_str
+
+    def get_git_command_str(self) -> str:
+        if not self._git_command_str:
+            self._git_command_str = str(lib_bash.get_bash_command('git').command_string)
+        return self._git_command_str
+
+    def get_ls_commands_prepend_sudo(self, ls_commands: List[str]) -> List[str]:
+        if not self.use_sudo:
+            return ls_commands
+        if self._sudo_command_str is None:
+            self._sudo_command_str = lib_helpers.get_sudo_command_str()
+        if self._sudo_command_str:
+            return [self._sudo_command_str] + ls_commands
+        return ls_commands
+
+    def get_installed_index(self) -> Dict[str, str]:
+        """
+        :returns the installed pip packages {normalized_package_name: version}, read once from "pip list"
+        """
+        if self._installed_index is None:
+            installed_index = dict()                # type: Dict[str, str]
+            ls_commands = [self.get_pip_command_str(), 'list', '--format=freeze']
+            for line in lib_stream.ShellLineStream(ls_commands):
+                if '==' in line:
+                    package_name, version = line.split('==', 1)
+                    installed_index[lib_helpers.get_normalized_package_name(package_name.strip())] = version.strip()
+            self._installed_index = installed_index
+        return self._installed_index
+
+    def invalidate_installed_index(self) -> None:
+        self._installed_index = None
+
+    def get_installed_version(self, package_name: str) -> str:
+        """
+        :returns the installed version of the package, or '' if not installed - the package_name might have a version specifier
+        """
+        return self.get_installed_index().get(lib_helpers.get_normalized_package_name(get_bare_package_name(package_name)), '')
+
+    def get_git_remote_hash(self, git_repository_slug: str) -> str:
+        if git_repository_slug not in self._git_remote_hashes:
+            self._git_remote_hashes[git_repository_slug] = lib_helpers.get_git_remote_hash(git_repository_slug=git_repository_slug,
+                                                                                           git_command_str=self.get_git_command_str())
+        return self._git_remote_hashes[git_repository_slug]
+
+    def get_version_store(self) -> Dict[str, str]:
+        if self._version_store is None:
+            self._version_store = lib_helpers.load_version_database()
+        return self._version_store
+
+    def save_git_hash(self, key: str, git_hash: str) -> None:
+        """
+        stores the git hash of the key (the git link) in the version store, an empty git_hash removes the key.
+        the file is read again right before, so the entries written by other processes in the meantime are kept
+
+        >>> import pathlib, tempfile
+        >>> save_path_version_file = lib_helpers.Config.path_version_file
+        >>> with tempfile.TemporaryDirectory() as tmp_dir:
+        ...     lib_helpers.Config.path_version_file = pathlib.Path(tmp_dir) / 'versions.dat'
+        ...     _ = lib_helpers.save_version_database({'a': 'A'})
+        ...     updater = Updater()
+        ...     assert updater.get_version_store() == {'a': 'A'}
+        ...     _ = lib_helpers.save_version_database({'a': 'A', 'b': 'B'})     # written by another process
+        ...     updater.save_git_hash(key='c', git_hash='C')
+        ...     updater.save_git_hash(key='a', git_hash='')
+        ...     assert lib_helpers.load_version_database() == updater.get_version_store() == {'b': 'B', 'c': 'C'}
+        >>> lib_helpers.Config.path_version_file = save_path_version_file
+
+        """
+        version_store = lib_helpers.load_version_database()
+        if git_hash:
+            version_store[key] = git_hash
+        else:
+            version_store.pop(key, None)
+        lib_helpers.save_version_database(version_store)
+        self._version_store = version_store
+
+    # check
+
+    def check(self, package_name: str, package_link: str = '') -> PackageResult:
+        start_time = time.perf_counter()
+        package_type = lib_helpers.get_package_type(package_link)
+        installed_version = self.get_installed_version(package_name)
+
+        if package_type == 'git_package':
+            old_version = self.get_version_store().get(package_link, '')
+            new_version = self.get_git_remote_hash(lib_helpers.get_git_repository_slug_from_link(package_link=package_link))
+            if not installed_version:
+                action = ACTION_NOT_INSTALLED
+            elif old_version == new_version:
+                action = ACTION_UP_TO_DATE
+            else:
+                action = ACTION_UPDATE_AVAILABLE
+        else:
+            old_version = installed_version
+            new_version = ''
+            action = ACTION_UNKNOWN if installed_version else ACTION_NOT_INSTALLED
+
+        return PackageResult(package_name=package_name, package_link=package_link, package_type=package_type, action=action,
+                             old_version=old_version, new_version=new_version, check_seconds=time.perf_counter() - start_time)
+
+    def check_many(self, packages: Iterable[Tuple[str, str]]) -> List[PackageResult]:
+        """
+        :param packages: (package_name, package_link) - the package_link might be ''
+        """
+        return [self.check(package_name=package_name, package_link=package_link) for package_name, package_link in packages]
+
+    # update
+
+    def update(self, package_name: str, package_link: str = '') -> PackageResult:
+        """
+        updates (or installs) the package - raises on errors, like pip_update does
+        """
+        result = self._update(package_name=package_name, package_link=package_link)
+        return self._finish_updates([result])[0]
+
+    def update_many(self, packages: Iterable[Tuple[str, str]]) -> List[PackageResult]:
+        """
+        updates (or installs) the packages - errors are reported as ACTION_FAILED, the remaining packages are still updated.
+        the installed index is read once, and again after each installation
+
+        :param packages: (package_name, package_link) - the package_link might be ''
+        """
+        results = list()        # type: List[PackageResult]
+        for package_name, package_link in packages:
+            try:
+                result = self._update(package_name=package_name, package_link=package_link)
+            except Exception as exc:
+                result = PackageResult(package_name=package_name, package_link=package_link,
+                                       package_type=lib_helpers.get_package_type(package_link), action=ACTION_FAILED, error=str(exc))
+            results.append(result)
+        return self._finish_updates(results)
+
+    def pip_install_upgrade(self, package_name_or_link: str) -> bool:
+        """
+        :returns updated - False if pip reports the requirement as already up to date / satisfied.
+        that is only a hint from the pip output - Updater.update compares the installed versions instead.
+        the installed index is not invalidated here, the caller needs to do that after the updates
+        """
+        return self._pip_install(package_name_or_link=package_name_or_link, pip_install_options=['--upgrade'])
+
+    def pip_will_install(self, package_name: str, package_name_or_link: str) -> bool:
+        """
+        :returns True if "pip install --upgrade" would install the package, from "pip install --dry-run --report".
+        True as well if the pip version does not support --dry-run (pip < 22.2), because then it is unknown
+        """
+        ls_commands = [self.get_pip_command_str(), 'install', '--upgrade', '--dry-run', '--quiet', '--report', '-', package_name_or_link]
+        try:
+            # the report lists only the packages to install, so it is small enough to keep
+            report = json.loads('\n'.join(lib_stream.ShellLineStream(ls_commands, tail_lines=0)))
+        except (subprocess.CalledProcessError, ValueError) as exc:
+            logger.debug('pip install --dry-run failed for "{package}": {exc}'.format(package=package_name_or_link, exc=exc))
+            return True
+        normalized_package_name = lib_helpers.get_normalized_package_name(get_bare_package_name(package_name))
+        return any(lib_helpers.get_normalized_package_name(str(install.get('metadata', dict()).get('name', ''))) == normalized_package_name
+                   for install in report.get('install', list()))
+
+    def _pip_install(self, package_name_or_link: str, pip_install_options: List[str]) -> bool:
+        """
+        :returns updated - False if pip reports the requirement as already up to date / satisfied
+        """
+        # pip < 20.3 reports "already up-to-date", the new resolver "already satisfied"
+        l_texts_up_to_date = ['Requirement already up-to-date: {pypy_package}'.format(pypy_package=package_name_or_link),
+                              'Requirement already satisfied: {pypy_package}'.format(pypy_package=package_name_or_link)]
+        try:
+            ls_commands = self.get_ls_commands_prepend_sudo([self.get_pip_command_str(), "install"] + pip_install_options + [package_name_or_link])
+            stream = lib_stream.ShellLineStream(ls_commands, pass_std_out_line_by_line=self.show_output)
+            updated = not lib_stream.contains_text(stream, l_texts_up_to_date)
+        except subprocess.CalledProcessError as exc:
+            if exc.returncode == 13:   # pip permission error
+                raise PermissionError(exc.stderr)
+            else:
+                error = 'Package "{pypy_package}" can not be installed via pip:\n\n{stderr}'.format(pypy_package=package_name_or_link, stderr=exc.stderr)
+                lib_log_utils.banner_error(error)
+                raise ValueError(error)
+        return updated
+
+    # rollback
+
+    def rollback(self, package_name: str) -> PackageResult:
+        """
+        reinstalls the previous version of the package from the local snapshot, and restores its git hash in the version store.
+        raises FileNotFoundError if there is no snapshot of the package
+        """
+        start_time = time.perf_counter()
+        snapshot = lib_snapshot.get_snapshot(get_bare_package_name(package_name))
+        if snapshot.version_key:
+            old_version = self.get_version_store().get(snapshot.version_key, '')
+            new_version = snapshot.git_hash
+        else:
+            old_version = self.get_installed_version(package_name)
+            new_version = snapshot.version
+
+        # --no-index: never fall back to the network
+        self._pip_install(package_name_or_link=snapshot.path_wheel, pip_install_options=['--force-reinstall', '--no-deps', '--no-index'])
+        self.invalidate_installed_index()
+
+        if snapshot.version_key:
+            self.save_git_hash(key=snapshot.version_key, git_hash=snapshot.git_hash)
+        # the snapshot is the installed version now
+        lib_snapshot.remove_snapshot(snapshot.package_name)
+
+        return PackageResult(package_name=package_name, package_link=snapshot.version_key, package_type=lib_helpers.get_package_type(snapshot.version_key),
+                             action=ACTION_ROLLED_BACK, old_version=old_version, new_version=new_version,
+                             update_seconds=time.perf_counter() - start_time)
+
+    def rollback_last_run(self) -> List[PackageResult]:
+        """
+        rolls back all packages updated by the last run (the snapshots with the newest run_id).
+        the snapshots are removed after the rollback, so each call steps one run further back.
+        raises FileNotFoundError if there are no snapshots
+        """
+        return [self.rollback(snapshot.package_name) for snapshot in lib_snapshot.get_snapshots_of_last_run()]
+
+    def _create_snapshot(self, check_result: PackageResult) -> lib_snapshot.Snapshot:
+        """ :returns the pending snapshot of the installed package, None if the snapshot can not be taken """
+        if not self.snapshot or check_result.action == ACTION_NOT_INSTALLED:
+            return None
+        version_key = check_result.package_link if check_result.package_type == 'git_package' else ''
+        git_hash = check_result.old_version if check_result.package_type == 'git_package' else ''
+        try:
+            return lib_snapshot.create_snapshot(package_name=get_bare_package_name(check_result.package_name), pip_command_str=self.get_pip_command_str(),
+                                                version_key=version_key, git_hash=git_hash)
+        except Exception as exc:
+            logger.warning('no rollback snapshot for package "{package_name}": {exc}'.format(package_name=check_result.package_name, exc=exc))
+            return None
+
+    def _update(self, package_name: str, package_link: str) -> PackageResult:
+        """
+        updates the package - the action is decided by comparing the installed version (the git hash for git packages)
+        before and after the installation, the installed index is read again after each installation
+        """
+        check_result = self.check(package_name=package_name, package_link=package_link)
+        if check_result.action == ACTION_UP_TO_DATE:
+            return check_result
+
+        start_time = time.perf_counter()
+        old_installed_version = self.get_installed_version(package_name)
+        package_name_or_link = package_name if check_result.package_type == 'pypy_package' else package_link
+        if self.snapshot and check_result.action == ACTION_UNKNOWN:
+            # only pip knows if there is an update - ask before the snapshot is packed
+            if not self.pip_will_install(package_name=package_name, package_name_or_link=package_name_or_link):
+                return check_result._replace(action=ACTION_UP_TO_DATE, new_version=old_installed_version,
+                                             update_seconds=time.perf_counter() - start_time)
+        snapshot = self._create_snapshot(check_result)
+        try:
+            self.pip_install_upgrade(package_name_or_link=package_name_or_link)
+            if check_result.package_type == 'git_package':
+                self.save_git_hash(key=package_link, git_hash=check_result.new_version)
+        except Exception:
+            if snapshot is not None:
+                lib_snapshot.discard_snapshot(snapshot)
+            raise
+        # pip might have installed or upgraded dependencies too
+        self.invalidate_installed_index()
+        new_installed_version = self.get_installed_version(package_name)
+
+        if check_result.package_type == 'git_package':
+            result = check_result
+            changed = check_result.old_version != check_result.new_version or old_installed_version != new_installed_version
+        else:
+            result = check_result._replace(new_version=new_installed_version)
+            changed = old_installed_version != new_installed_version
+
+        if snapshot is not None:
+            # keep the snapshot only if the package changed, otherwise the snapshot of an earlier update would be lost
+            if changed:
+                lib_snapshot.commit_snapshot(snapshot, run_id=self.run_id)
+            else:
+                lib_snapshot.discard_snapshot(snapshot)
+
+        if not old_installed_version:
+            action = ACTION_INSTALLED
+        elif changed:
+            action = ACTION_UPDATED
+        else:
+            action = ACTION_UP_TO_DATE
+
+        return result._replace(action=action, update_seconds=time.perf_counter() - start_time)
+
+    def _finish_updates(self, results: List[PackageResult]) -> List[PackageResult]:
+        """ runs the post install stage for the updated packages """
+        l_updated_package_names = [get_bare_package_name(result.package_name) for result in results if result.updated]
+        if not l_updated_package_names:
+            return results
+
+        if self.precompile or self.smoke_import:
+            warmup_results = lib_warmup.warmup_packages(package_names=l_updated_package_names, pip_command_str=self.get_pip_command_str(),
+                                                        precompile=self.precompile, smoke_import=self.smoke_import, use_sudo=self.use_sudo)
+            for warmup_result in warmup_results.values():
+                lib_warmup.log_warmup_result(warmup_result)
+            results = [result._replace(warmup=warmup_results[get_bare_package_name(result.package_name)]) if result.updated else result
+                       for result in results]
+        return results
+
+
+def get_bare_package_name(package_name: str) -> str:
+    """
+    :returns the package name without version specifier, extras and marker - for the installed index, the snapshots and the warmup
+
+    >>> get_bare_package_name('urllib3==1.24.1')
+    'urllib3'
+    >>> get_bare_package_name('lib_doctest_pycharm')
+    'lib_doctest_pycharm'
+
+    """
+    return lib_helpers.get_pypy_package_name_without_version(package_name) or package_name
@@ -0,0 +1,260 @@
+# STDLIB
+import concurrent.futures
+import functools
+import logging
+import os
+import pathlib
+import re
+import shutil
+import subprocess
+import sys
+import time
+from typing import Dict, Iterable, List, NamedTuple, Tuple
+
+# PROJ
+try:
+    from . import lib_helpers
+    from . import lib_stream
+    from .config import Config
+except ImportError:                 # for local development
+    import lib_helpers              # type: ignore # pragma: no cover
+    import lib_stream               # type: ignore # pragma: no cover
+    from config import Config       # type: ignore # pragma: no cover
+
+logger = logging.getLogger()
+
+
+class WarmupResult(NamedTuple):
+    """
+    the result of the post install stage for one package - compile_seconds is the time for the whole batch,
+    because the files of all packages are compiled in one process pool
+    """
+    package_name: str
+    compiled_files: int = 0
+    failed_files: int = 0
+    compile_seconds: float = 0.0
+    imported_modules: Tuple[str, ...] = ()
+    failed_imports: Tuple[str, ...] = ()
+    import_seconds: float = 0.0
+
+
+def warmup_packages(package_names: Iterable[str], pip_command_str: str, precompile: bool = True, smoke_import: bool = False,
+                    use_sudo: bool = False) -> Dict[str, WarmupResult]:
+    """
+    precompiles the python files of the (changed) packages in parallel, and optionally imports their top level modules
+    in a fresh interpreter to verify the installation - both with the python interpreter the pip command belongs to.
+    use_sudo precompiles as root, like pip installed the packages - the smoke import runs as the current user.
+    errors are reported in the results, not raised - for instance when site-packages is read only
+
+    >>> results = warmup_packages(['pip'], pip_command_str=shutil.which('pip3') or shutil.which('pip'), precompile=False, smoke_import=True)
+    >>> assert results['pip'].compiled_files == 0
+    >>> assert 'pip' in results['pip'].imported_modules
+    >>> assert not results['pip'].failed_imports
+
+    """
+    python_command_str = get_python_command_of_pip(pip_command_str)
+    results = dict()                                    # type: Dict[str, WarmupResult]
+    l_python_files_by_package = dict()                  # type: Dict[str, List[str]]
+    l_modules_by_package = dict()                       # type: Dict[str, List[str]]
+
+    for package_name in package_names:
+        try:
+            location, files = get_distribution_files(package_name=package_name, pip_command_str=pip_command_str)
+        except (subprocess.CalledProcessError, OSError) as exc:
+            logger.warning('can not get the files of package "{package_name}": {exc}'.format(package_name=package_name, exc=exc))
+            location, files = pathlib.Path(), list()
+        l_python_files_by_package[package_name] = [str(location / file) for file in files if file.endswith('.py') and not file.startswith('..')]
+        l_modules_by_package[package_name] = get_top_level_modules(files)
+        results[package_name] = WarmupResult(package_name=package_name)
+
+    if precompile:
+        # one process pool for the files of all packages
+        start_time = time.perf_counter()
+        l_compiled = compile_files(python_command_str, [python_file for l_python_files in l_python_files_by_package.values() for python_file in l_python_files],
+                                   use_sudo=use_sudo)
+        compile_seconds = time.perf_counter() - start_time
+        index = 0
+        for package_name, l_python_files in l_python_files_by_package.items():
+            l_compiled_package = l_compiled[index:index + len(l_python_files)]
+            index += len(l_python_files)
+            results[package_name] = results[package_name]._replace(compiled_files=l_compiled_package.count(True),
+                                                                   failed_files=l_compiled_package.count(False),
+                                                                   compile_seconds=compile_seconds)
+
+    if smoke_import:
+        for package_name, l_modules in l_modules_by_package.items():
+            start_time = time.perf_counter()
+            l_failed_imports = [module for module in l_modules if not is_module_importable(python_command_str, module)]
+            results[package_name] = results[package_name]._replace(imported_modules=tuple(l_modules),
+                                                                   failed_imports=tuple(l_failed_imports),
+                                                                   import_seconds=time.perf_counter() - start_time)
+    return results
+
+
+def get_distribution_files(package_name: str, pip_command_str: str) -> Tuple[pathlib.Path, List[str]]:
+    """
+    :returns the location (site-packages) and the files of the installed package, relative to the location - from "pip show -f"
+
+    """
+    location = pathlib.Path()
+    files = list()                  # type: List[str]
+    in_files_section = False
+    for line in lib_stream.ShellLineStream([pip_command_str, 'show', '-f', package_name]):
+        if in_files_section:
+            if line.startswith(' '):
+                files.append(line.strip())
+            else:
+                in_files_section = False
+        if line.startswith('Location:'):
+            location = pathlib.Path(line.split(':', 1)[1].strip())
+        elif line.startswith('Files:'):
+            in_files_section = True
+    return location, files
+
+
+def get_top_level_modules(files: Iterable[str]) -> List[str]:
+    """
+    >>> get_top_level_modules(['pip/__init__.py', 'pip/_internal/main.py', 'pip-19.2.dist-info/RECORD', '../../../bin/pip', 'six.py'])
+    ['pip', 'six']
+    >>> get_top_level_modules(['__pycache__/six.cpython-37.pyc', 'six.py'])
+    ['six']
+
+    """
+    l_modules = list()              # type: List[str]
+    for file in files:
+        elements = pathlib.PurePosixPath(file).parts
+        if not elements or elements[0] in ('..', '__pycache__') or elements[0].endswith(('.dist-info', '.egg-info')):
+            continue
+        if len(elements) == 1:
+            module = elements[0][:-len('.py')] if elements[0].endswith('.py') else ''
+        else:
+            module = elements[0] if elements[-1] == '__init__.py' and len(elements) == 2 else ''
+        if module and module.isidentifier() and module not in l_modules:
+            l_modules.append(module)
+    return l_modules
+
+
+def get_python_command_of_pip(pip_command_str: str) -> str:
+    """
+    :returns the python interpreter the pip command belongs to - from the shebang of the pip script,
+    otherwise from the python version reported by "pip -V", otherwise the current interpreter
+
+    >>> assert get_python_command_of_pip(shutil.which('pip3') or shutil.which('pip'))
+
+    """
+    return _get_python_command_of_pip(pip_command_str)
+
+
+@functools.lru_cache(maxsize=None)
+def _get_python_command_of_pip(pip_command_str: str) -> str:
+    try:
+        with open(pip_command_str, 'rb') as pip_script:
+            first_line = pip_script.readline(4096).decode('utf-8', errors='replace').strip()
+    except OSError:
+        first_line = ''
+    if first_line.startswith('#!'):
+        shebang = first_line[2:].split()
+        if shebang and pathlib.Path(shebang[0]).name == 'env' and len(shebang) > 1:
+            shebang = [shutil.which(shebang[1]) or '']
+        if shebang and shebang[0] and 'python' in pathlib.Path(shebang[0]).name and pathlib.Path(shebang[0]).exists():
+            return shebang[0]
+
+    try:
+        # pip 19.2 from /usr/lib/python3/dist-packages/pip (python 3.7)
+        pip_version_line = lib_stream.grep_first(lib_stream.ShellLineStream([pip_command_str, '-V']), r'\(python \d+\.\d+\)')
+    except (subprocess.CalledProcessError, OSError):
+        pip_version_line = ''
+    match = re.search(r'\(python (\d+\.\d+)\)', pip_version_line)
+    if match:
+        python_command_str = shutil.which('python{version}'.format(version=match.group(1)))
+        if python_command_str:
+            return python_command_str
+
+    logger.warning('can not find the python interpreter of "{pip}", using "{python}"'.format(pip=pip_command_str, python=sys.executable))
+    return sys.executable
+
+
+# compiles the files given on stdin, and writes 1 (compiled) or 0 (failed) for each file
+_COMPILE_SCRIPT = """
+import py_compile, sys
+for python_file in sys.stdin.read().splitlines():
+    try:
+        py_compile.compile(python_file, doraise=True)
+        print(1)
+    except Exception:
+        print(0)
+"""
+
+
+def compile_files(python_command_str: str, l_python_files: List[str], use_sudo: bool = False) -> List[bool]:
+    """
+    compiles the files with the given python interpreter, in parallel processes - as root if use_sudo
+    :returns for each file True if compiled, False if it failed
+
+    >>> import tempfile
+    >>> with tempfile.TemporaryDirectory() as tmp_dir:
+    ...     good_file = pathlib.Path(tmp_dir) / 'good.py'
+    ...     _ = good_file.write_text('a = 1\\n')
+    ...     bad_file = pathlib.Path(tmp_dir) / 'bad.py'
+    ...     _ = bad_file.write_text('a = \\n')
+    ...     compile_files(sys.executable, [str(good_file), str(bad_file), str(good_file)])
+    [True, False, True]
+
+    """
+    if not l_python_files:
+        return list()
+    max_workers = min(Config.precompile_workers or os.cpu_count() or 1, len(l_python_files))
+    chunksize = -(-len(l_python_files) // max_workers)
+    l_chunks = [l_python_files[index:index + chunksize] for index in range(0, len(l_python_files), chunksize)]
+    ls_commands = lib_helpers.get_ls_commands_prepend_sudo([python_command_str, '-c', _COMPILE_SCRIPT], use_sudo=use_sudo)
+    # the processes do the work, the threads only wait for them
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        l_l_compiled = executor.map(functools.partial(_compile_chunk, ls_commands), l_chunks)
+        return [compiled for l_compiled in l_l_compiled for compiled in l_compiled]
+
+
+def _compile_chunk(ls_commands: List[str], l_python_files: List[str]) -> List[bool]:
+    try:
+        process = subprocess.run(ls_commands, input='\n'.join(l_python_files),
+                                 stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True)
+    except OSError:
+        return [False] * len(l_python_files)
+    l_compiled = [line.strip() == '1' for line in process.stdout.splitlines()]
+    # a crashed interpreter did not compile the rest of the files
+    return (l_compiled + [False] * len(l_python_files))[:len(l_python_files)]
+
+
+def is_module_importable(python_command_str: str, module: str) -> bool:
+    """
+    imports the module in a fresh interpreter, which is killed after Config.smoke_import_timeout seconds
+
+    >>> assert is_module_importable(sys.executable, 'json')
+    >>> assert not is_module_importable(sys.executable, 'unknown_module_xyz')
+
+    """
+    try:
+        subprocess.run([python_command_str, '-c', 'import {module}'.format(module=module)],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True, timeout=Config.smoke_import_timeout)
+        return True
+    except subprocess.TimeoutExpired:
+        logger.warning('importing "{module}" did not finish within {timeout} seconds'.format(module=module, timeout=Config.smoke_import_timeout))
+        return False
+    except (subprocess.CalledProcessError, OSError):
+        return False
+
+
+def log_warmup_result(warmup_result: WarmupResult) -> None:
+    """
+    >>> log_warmup_result(WarmupResult('pip', 10, 1, 0.5, ('pip',), ('pip',), 0.1))
+    """
+    logger.info('{package_name}: precompiled {compiled} files, {failed} failed, in {compile_seconds:.2f} seconds - '
+                'imported {imported} modules in {import_seconds:.2f} seconds'
+                .format(package_name=warmup_result.package_name, compiled=warmup_result.compiled_files, failed=warmup_result.failed_files,
+                        compile_seconds=warmup_result.compile_seconds, imported=len(warmup_result.imported_modules),
+                        import_seconds=warmup_result.import_seconds))
+    if warmup_result.failed_files:
+        logger.warning('{package_name}: {failed} files could not be precompiled'.format(package_name=warmup_result.package_name,
+                                                                                         failed=warmup_result.failed_files))
+    if warmup_result.failed_imports:
+        logger.error('{package_name}: the smoke import failed for: {modules}'.format(package_name=warmup_result.package_name,
+                                                                                      modules=', '.join(warmup_result.failed_imports)))
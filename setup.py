@@ -13,9 +13,7 @@ except ImportError:
 package_name = 'configmagick_update'   # type: ignore
 required = ['chardet',
             'configmagick_bash @ git+https://github.com/bitranox/configmagick_bash.git',
-            'lib_log_utils @ git+https://github.com/bitranox/lib_log_utils.git',
-            'lib_shell @ git+https://github.com/bitranox/lib_shell.git',
-            'lib_regexp @ git+https://github.com/bitranox/lib_regexp.git']            # type: ignore
+            'lib_log_utils @ git+https://github.com/bitranox/lib_log_utils.git']            # type: ignore
 required_for_tests = list()     # type: ignore
 entry_points = dict()           # type: ignore
 